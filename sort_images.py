@@ -2,11 +2,31 @@ import os
 import sys
 import shutil
 import math
+import subprocess
+import traceback
 import cv2
+import numpy as np
 import exiftool 
 import logging
+import io
+import multiprocessing
+import queue
+import threading
+import json
+import base64
+import mmap
+import sqlite3
 
 import configparser
+import contextlib
+from dataclasses import dataclass, replace
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Optional: JPEG decoding on NVIDIA GPUs (pip install nvjpeg-python)
+try:
+    from nvjpeg import NvJpeg
+except ImportError:
+    NvJpeg = None
 
 # --- DEFAULTS (Used if config is missing) ---
 DEFAULT_CONFIG = {
@@ -15,6 +35,7 @@ DEFAULT_CONFIG = {
         "max_speed_mps": "5.0",
         "max_digital_zoom": "1.0",
         "min_blur_score": "100.0",
+        "analysis_size": "0",  # 0 = full resolution; >0 = long edge (px) to shrink to (min_blur_score must be retuned)
         "min_width": "3000",
         "min_height": "2000",
         "max_iso": "1600",
@@ -22,7 +43,12 @@ DEFAULT_CONFIG = {
         "max_brightness": "240.0"
     },
     "Settings": {
-        "image_folder": "."  # "." means current folder
+        "image_folder": ".",  # "." means current folder
+        "log_all_reasons": "false",  # true = also run blur/brightness on images the metadata already rejected
+        "gpu_decode": "false",  # true = decode JPEGs on an NVIDIA GPU (needs nvjpeg-python)
+        "workers": "0",  # 0 = one process per CPU core, 1 = single process (OpenCV multithreads each image)
+        "use_preview": "false",  # true = measure blur/brightness on the camera's embedded JPEG preview (retune min_blur_score)
+        "fast_reject": "false"  # true = log metadata rejects with their reasons only (also: run with --fast)
     }
 }
 
@@ -33,6 +59,30 @@ def get_script_dir():
     else:
         return os.path.dirname(os.path.abspath(__file__))
 
+@dataclass(frozen=True)
+class Config:
+    """Parsed configuration: built once, read with attribute access in the per-image code.
+    The defaults are used when config.ini can't be parsed."""
+    # Filters
+    min_dist: float = 20.0
+    max_speed: float = 5.0
+    max_speed_sq: float = 25.0 # Derived: max_speed ** 2
+    max_zoom: float = 1.0
+    min_blur: float = 100.0
+    analysis_size: int = 0 # 0 = full resolution
+    min_w: int = 3000
+    min_h: int = 2000
+    max_iso: int = 1600
+    min_bright: float = 20.0
+    max_bright: float = 240.0
+    # Settings
+    img_folder: str = '.'
+    log_all_reasons: bool = False
+    gpu_decode: bool = False
+    workers: int = 0
+    use_preview: bool = False
+    fast_reject: bool = False
+
 def load_config(script_dir):
     """Load config.ini or create it if missing."""
     config_path = os.path.join(script_dir, 'config.ini')
@@ -56,25 +106,28 @@ def load_config(script_dir):
         cfg['max_speed'] = float(f.get('max_speed_mps', 5.0))
         cfg['max_zoom'] = float(f.get('max_digital_zoom', 1.0))
         cfg['min_blur'] = float(f.get('min_blur_score', 100.0))
+        cfg['analysis_size'] = int(f.get('analysis_size', 0))
         cfg['min_w'] = int(f.get('min_width', 3000))
         cfg['min_h'] = int(f.get('min_height', 2000))
         cfg['max_iso'] = int(f.get('max_iso', 1600))
         cfg['min_bright'] = float(f.get('min_brightness', 20.0))
         cfg['max_bright'] = float(f.get('max_brightness', 240.0))
+        cfg['max_speed_sq'] = cfg['max_speed'] ** 2
         
         # Settings
         raw_folder = config['Settings'].get('image_folder', '.')
         # Fix: Remove quotes if user added them in config.ini (common mistake)
         cfg['img_folder'] = raw_folder.strip('"').strip("'")
+        cfg['log_all_reasons'] = config['Settings'].getboolean('log_all_reasons', False)
+        cfg['gpu_decode'] = config['Settings'].getboolean('gpu_decode', False)
+        cfg['workers'] = config['Settings'].getint('workers', 0)
+        cfg['use_preview'] = config['Settings'].getboolean('use_preview', False)
+        cfg['fast_reject'] = config['Settings'].getboolean('fast_reject', False)
         
-        return cfg
+        return Config(**cfg)
     except Exception as e:
         print(f"Error reading config: {e}. Using defaults.")
-        return {
-            'min_dist': 20.0, 'max_speed': 5.0, 'max_zoom': 1.0, 'min_blur': 100.0,
-            'min_w': 3000, 'min_h': 2000, 'max_iso': 1600, 'min_bright': 20.0, 'max_bright': 240.0,
-            'img_folder': '.'
-        }
+        return Config()
 
 def get_resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -86,32 +139,97 @@ def get_resource_path(relative_path):
 
     return os.path.join(base_path, relative_path)
 
-def get_image_metrics(file_path, et):
+# Only the tags the grading logic reads; keeps ExifTool's parse and JSON output small
+METADATA_TAGS = [
+    'EXIF:ExifImageWidth', 'EXIF:ExifImageHeight', 'ImageWidth', 'ImageHeight',
+    'Composite:DigitalZoomRatio', 'EXIF:ISO',
+    'Composite:FocalLength35efl', 'EXIF:FocalLengthIn35mmFormat',
+    'XMP:LRFTargetDistance', 'XMP:FlightSpeed', 'XMP:GimbalPitchDegree'
+]
+
+METADATA_ARGS = ['-' + tag for tag in METADATA_TAGS]
+
+def path_key(path):
+    """Normalized path used to match ExifTool's SourceFile back to our file list."""
+    return os.path.normcase(os.path.abspath(path))
+
+def read_metadata_batch(et, file_paths):
+    """
+    Reads the metadata of all files with a single ExifTool call.
+    Returns a dictionary of {path_key: metadata}.
     """
-    Extracts all logic-relevant data from the image.
-    Returns a dictionary of metrics.
+    # This is one transaction with the -stay_open process: PyExifTool streams all the
+    # arguments (tags + every path) through ExifTool's "-@ -" argfile on stdin and
+    # gets a single JSON array back, so there is no per-file round-trip to save.
+    try:
+        metadata_list = et.execute_json(*METADATA_ARGS, *file_paths)
+    except exiftool.exceptions.ExifToolOutputEmptyError:
+        return {} # None of the files could be read (e.g. all removed meanwhile)
+    return {path_key(m['SourceFile']): m for m in metadata_list if 'SourceFile' in m}
+
+def read_all_metadata(et, file_paths):
+    """
+    Reads the metadata of all files in batches of METADATA_BATCH_SIZE, a generator:
+    the caller can work on one batch while the next is read.
+    Yields one list per batch, the metadata of each file in order (None = not found).
+    """
+    for start in range(0, len(file_paths), METADATA_BATCH_SIZE):
+        batch = file_paths[start:start + METADATA_BATCH_SIZE]
+        metadata = read_metadata_batch(et, batch)
+        print(f"  Metadata: {start + len(batch)}/{len(file_paths)}")
+        yield [metadata.get(path_key(p)) for p in batch]
+
+def read_previews(et, file_paths):
+    """
+    The JPEG previews the camera embedded in the files (DJI: MPF preview), with a single
+    ExifTool call. et must be a session without -fast: it skips the trailers some previews live in.
+    Returns a dictionary of {path_key: JPEG bytes}, files without a preview are left out.
+    """
+    try:
+        # With -j, -b returns the binary data base64 encoded ("base64:...")
+        metadata_list = et.execute_json('-b', '-PreviewImage', *file_paths)
+    except exiftool.exceptions.ExifToolOutputEmptyError:
+        return {}
+    previews = {}
+    for m in metadata_list:
+        data = m.get('PreviewImage')
+        if isinstance(data, str) and data.startswith('base64:'):
+            data = base64.b64decode(data[len('base64:'):])
+            if data.startswith(b'\xff\xd8'):
+                previews[path_key(m['SourceFile'])] = data
+    return previews
+
+# Previews per ExifTool call: up to ~1 MB each (2x as base64 JSON), kept in small batches
+PREVIEW_BATCH_SIZE = 20
+
+# Files per ExifTool call: large enough to amortize the round-trip, small enough to
+# bound the JSON reply and show progress on big folders
+METADATA_BATCH_SIZE = 200
+
+def get_image_metrics(metadata):
+    """
+    Extracts all metadata-based data from the image's (pre-fetched) metadata.
+    Returns a dictionary of metrics (visual fields are filled in by analyze_visual).
     """
     metrics = {
         'width': 0, 'height': 0,
         'digital_zoom': 1.0,
         'focal_length': 0.0,
         'iso': 0,
-        'blur_score': 0.0,
-        'brightness': 0.0,
+        'blur_score': None, # None = visual pass not run (yet)
+        'brightness': None,
         'distance': 9999.0, # Default to safe distance if missing? Or fail? Let's check.
-        'speed': 0.0,
+        'speed_sq': 0.0, # Squared magnitude, the threshold is squared instead of taking a sqrt per image
         'gimbal_pitch': 0.0,
         'load_error': None,
         'meta_error': None,
         'has_distance': False
     }
 
-    # 1. Metadata Extraction
+    # Metadata Extraction
     try:
-        metadata_list = et.get_metadata(file_path)
-        if metadata_list:
-            metadata = metadata_list[0]
-            
+        # ExifTool names every file it was given (SourceFile), even one it could not parse
+        if metadata and metadata.keys() - {'SourceFile'}:
             # Resolution
             w = metadata.get('EXIF:ExifImageWidth', 0)
             h = metadata.get('EXIF:ExifImageHeight', 0)
@@ -139,143 +257,526 @@ def get_image_metrics(file_path, et):
             speed_str = metadata.get('XMP:FlightSpeed') # DJI specific
             if speed_str:
                 try:
-                    parts = [float(x) for x in speed_str.split(',')]
-                    if len(parts) >= 3:
-                        # Magnitude of 3D vector
-                        metrics['speed'] = math.sqrt(parts[0]**2 + parts[1]**2 + parts[2]**2)
-                except:
-                    pass # Keep 0.0 if parse fails
+                    x, y, z = map(float, speed_str.split(',')[:3])
+                    # Squared magnitude of 3D vector
+                    metrics['speed_sq'] = x * x + y * y + z * z
+                except (ValueError, AttributeError):
+                    pass # Keep 0.0 if parse fails (not "x,y,z")
 
             # Gimbal Pitch
             metrics['gimbal_pitch'] = float(metadata.get('XMP:GimbalPitchDegree', 0))
 
         else:
-            metrics['meta_error'] = "No Metadata Found"
+            metrics['meta_error'] = "No Metadata Found (Corrupt?)"
             
     except Exception as e:
         metrics['meta_error'] = str(e)
 
-    # 2. Visual Analysis
+    return metrics
+
+# libjpeg can decode straight to 1/2, 1/4 or 1/8 size (scaled IDCT), largest reduction first
+JPEG_REDUCED_READS = [
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+]
+
+def decode_file(file_path, flags, data=None):
+    """
+    Decodes the image from its bytes (data), or from a memory map of the file if
+    they weren't read yet. Unlike cv2.imread this also handles non-ASCII paths on Windows.
+    """
+    if data is not None:
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags) if data else None
+
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None # Empty file, can't be mapped
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            buf = np.frombuffer(mapped, dtype=np.uint8)
+            image = cv2.imdecode(buf, flags)
+            del buf # Release the view, the map can't close while it is exported
+    return image
+
+def read_grayscale(file_path, scale=1.0, data=None):
+    """
+    Reads the image as grayscale, letting the JPEG decoder do as much of the
+    downscale (by 'scale' per side) as it can without going below it.
+    Other formats (DNG, TIFF, PNG) are decoded at full size.
+    Returns the image, or None if it could not be read.
+    """
+    if file_path.lower().endswith(('.jpg', '.jpeg')):
+        if _gpu_decoder is not None:
+            try:
+                image = _gpu_decoder.read(file_path) if data is None else _gpu_decoder.decode(data)
+                if image is not None:
+                    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            except Exception:
+                pass # Fall back to the CPU decoder below
+        for factor, flag in JPEG_REDUCED_READS:
+            if scale * factor <= 1.0:
+                return decode_file(file_path, flag, data)
+    return decode_file(file_path, cv2.IMREAD_GRAYSCALE, data)
+
+# Laplacian output buffer of this process, reused while consecutive images have the same shape
+# (one camera, same mode) instead of a new allocation per image. Only the latest shape is
+# kept: at full resolution each one is a full-frame buffer (~24 MB at 12 MP).
+_laplacian_buffer = None
+
+def blur_and_brightness(image):
+    """
+    Both visual statistics of a (grayscale) image.
+    Returns (blur_score, brightness).
+    """
+    global _laplacian_buffer
+    # Brightness (Mean Pixel Intensity), taken while the freshly decoded buffer is still in cache
+    brightness = cv2.mean(image)[0]
+
+    # Blur (Laplacian Variance)
+    # On 8-bit input the 3x3 (ksize=1) Laplacian is an exact integer in [-1020, 1020], so a
+    # 16-bit output loses nothing and moves a quarter of the bytes of CV_64F.
+    # meanStdDev gets the variance in one pass.
+    if isinstance(image, cv2.UMat):
+        laplacian = cv2.Laplacian(image, cv2.CV_16S, ksize=1) # T-API manages its own buffers
+    else:
+        if _laplacian_buffer is None or _laplacian_buffer.shape != image.shape:
+            _laplacian_buffer = np.empty(image.shape, dtype=np.int16)
+        laplacian = _laplacian_buffer
+        cv2.Laplacian(image, cv2.CV_16S, dst=laplacian, ksize=1)
+    _, stddev = cv2.meanStdDev(laplacian)
+    if isinstance(stddev, cv2.UMat):
+        stddev = stddev.get() # Only the 1x1 result is copied back from the T-API buffer
+
+    return float(stddev[0, 0]) ** 2, brightness
+
+# Per-worker NvJpeg instance (None = decode on the CPU)
+_gpu_decoder = None
+
+def init_visual_worker(gpu_decode=False):
+    """Runs once in every worker process of the visual analysis pool."""
+    global _gpu_decoder
+    # The pool already uses every core; stop OpenCV from spawning its own threads on top
+    cv2.setNumThreads(1)
+
+    if gpu_decode and NvJpeg is not None:
+        try:
+            _gpu_decoder = NvJpeg()
+        except Exception:
+            _gpu_decoder = None # No usable GPU, stay on the CPU decoder
+
+# How far outside [min_brightness, max_brightness] a sampled mean must be to trust it
+BRIGHTNESS_SAMPLE_MARGIN = 10.0
+
+def analyze_visual(file_path, max_side=0, use_umat=False, data=None, bright_range=None, full_side=0):
+    """
+    Pixel-based analysis of a single image (normally runs inside a worker process).
+    The image is shrunk so its long edge is at most max_side pixels before measuring (0 = full resolution).
+    full_side is the original long edge from the metadata (0 = unknown), it lets the JPEG decoder do most of the shrinking.
+    use_umat runs the filters through OpenCV's T-API (OpenCL / multithreaded kernels).
+    data can hold the file's bytes if they were already read (see prefetch_files), or its embedded preview.
+    bright_range = (min, max) allows skipping the blur check for clearly too dark/bright frames.
+    Returns (blur_score, brightness, load_error) - blur_score is None if it was skipped.
+    """
     try:
-        # Read image in grayscale
-        image = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
-        
+        # Read image in grayscale (JPEGs come out of the decoder already reduced)
+        image = read_grayscale(file_path, max_side / full_side if max_side and full_side else 1.0, data)
+
         if image is None:
-            metrics['load_error'] = "Could not load image (Corrupt?)"
-        else:
-            # Blur (Laplacian Variance)
-            metrics['blur_score'] = cv2.Laplacian(image, cv2.CV_64F).var()
-            
-            # Brightness (Mean Pixel Intensity)
-            metrics['brightness'] = cv2.mean(image)[0]
+            return 0.0, 0.0, "Could not load image (Corrupt?)"
+
+        # Pitch-black or blown-out frames: a 1% pixel sample settles the brightness
+        # check with a wide margin, so the Laplacian is not needed to reject them
+        if bright_range is not None:
+            sample_mean = float(image[::10, ::10].mean())
+            if (sample_mean < bright_range[0] - BRIGHTNESS_SAMPLE_MARGIN
+                    or sample_mean > bright_range[1] + BRIGHTNESS_SAMPLE_MARGIN):
+                return None, sample_mean, None
+
+        # Optional downscale (analysis_size > 0) for a fraction of the work. Shrinking averages
+        # away fine detail, so the Laplacian variance rises sharply (50-100x at ~1 MP) and
+        # min_blur_score must be calibrated at the same size. INTER_AREA preserves the mean brightness.
+        scale = max_side / max(image.shape[:2]) if max_side else 1.0
+
+        if use_umat:
+            image = cv2.UMat(image)
+
+        if scale < 1.0:
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        blur_score, brightness = blur_and_brightness(image)
+        return blur_score, brightness, None
             
     except Exception as e:
-        metrics['load_error'] = str(e)
+        return 0.0, 0.0, str(e)
 
-    return metrics
+def prefetch_files(file_paths, depth=4):
+    """
+    Reads the files on a background thread, staying up to 'depth' files ahead of
+    the consumer so disk reads overlap with decoding.
+    Yields (file_path, data) in order - data is None if the file could not be read.
+    """
+    buffered = queue.Queue(maxsize=depth)
 
-def evaluate_image(metrics, cfg):
+    def reader():
+        for path in file_paths:
+            try:
+                with open(path, 'rb') as f:
+                    if hasattr(os, 'posix_fadvise'): # Linux only: ask for aggressive readahead
+                        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                    data = f.read()
+            except OSError:
+                data = None # The decoder will report the file as unreadable
+            buffered.put((path, data))
+
+    threading.Thread(target=reader, daemon=True).start()
+    for _ in file_paths:
+        yield buffered.get()
+
+def long_side(metrics):
+    """Long edge of the image according to its metadata (0 = unknown)."""
+    try:
+        return max(int(metrics['width']), int(metrics['height']))
+    except (TypeError, ValueError):
+        return 0
+
+def get_bright_range(cfg):
+    """analyze_visual's early brightness reject range - off if the user wants every check in the log."""
+    return None if cfg.log_all_reasons else (cfg.min_bright, cfg.max_bright)
+
+def create_visual_pool(cfg):
+    """The worker processes for the visual pass, or None when workers = 1 (single process)."""
+    if cfg.workers == 1:
+        return None
+    return ProcessPoolExecutor(max_workers=cfg.workers or os.cpu_count(), initializer=init_visual_worker,
+                               initargs=(cfg.gpu_decode,))
+
+def iter_visual_results(file_paths, full_sides, preview_et, cfg):
     """
-    Decides if an image is GOOD or BAD based on metrics.
-    Returns (is_good, log_string, reason_list)
+    Single-process visual pass (workers = 1): runs analyze_visual over the files and
+    yields the results in the same order. OpenCV parallelizes inside each image instead.
+    full_sides holds each file's long edge from the metadata (0 = unknown).
+    preview_et is the ExifTool session for the embedded previews (None = use_preview is off),
+    they are read PREVIEW_BATCH_SIZE at a time as the pass gets to them.
+    """
+    init_visual_worker(cfg.gpu_decode)
+    cv2.setUseOptimized(True)
+    cv2.setNumThreads(os.cpu_count())
+    step = PREVIEW_BATCH_SIZE if preview_et else max(len(file_paths), 1)
+    for start in range(0, len(file_paths), step):
+        paths = file_paths[start:start + step]
+        previews = read_previews(preview_et, paths) if preview_et else {}
+        # The next files are read from disk while the current one is decoded
+        reads = prefetch_files([p for p in paths if path_key(p) not in previews])
+        for file_path, full_side in zip(paths, full_sides[start:start + step]):
+            preview = previews.get(path_key(file_path))
+            if preview is not None:
+                yield analyze_visual(file_path, cfg.analysis_size, True, preview, get_bright_range(cfg))
+            else:
+                _, data = next(reads)
+                yield analyze_visual(file_path, cfg.analysis_size, True, data, get_bright_range(cfg), full_side)
+
+def needs_visual(metrics, cfg):
+    """
+    True if the image's blur/brightness still have to be measured (not cached). An image
+    whose blur check was skipped because it is clearly too dark/bright (blur_score None,
+    brightness known) is only measured again if that brightness would pass now.
+    """
+    if metrics['brightness'] is None:
+        return True
+    if metrics['blur_score'] is None:
+        return cfg.log_all_reasons or cfg.min_bright <= metrics['brightness'] <= cfg.max_bright
+    return False
+
+def gather_metrics(et, preview_et, file_paths, file_sizes, metrics_list, cfg, pool):
+    """
+    Fills in metrics_list (None = not cached) from ExifTool, in batches, and picks the
+    images that need the visual pass: decoding + Laplacian is by far the most expensive
+    step, so it is skipped for images the metadata already rejected (unless the user
+    wants every reason logged). With a pool, each batch's candidates are submitted right
+    away, so the workers decode while ExifTool reads the next batch.
+    Files are read in order of size, so a batch holds images of similar parse and decode cost.
+    preview_et is the ExifTool session for the embedded previews (None = use_preview is off).
+    Returns {index: Future} with a pool, else {index: None} (iter_visual_results does the work).
+    """
+    cached = [i for i, m in enumerate(metrics_list) if m is not None]
+    uncached = sorted((i for i, m in enumerate(metrics_list) if m is None), key=lambda i: file_sizes[i])
+    print(f"{len(cached)} images found in cache. Reading metadata of {len(uncached)} images...")
+
+    visual_jobs = {}
+    def queue_visual(batch):
+        meta_pass = metadata_pass_mask([metrics_list[i] for i in batch], cfg)
+        candidates = [i for i, passed in zip(batch, meta_pass)
+                      if (cfg.log_all_reasons or passed) and needs_visual(metrics_list[i], cfg)]
+        if pool is None:
+            # Single process: the previews are read later, as the visual pass gets to them
+            visual_jobs.update(dict.fromkeys(candidates))
+            return
+        for start in range(0, len(candidates), PREVIEW_BATCH_SIZE):
+            chunk = candidates[start:start + PREVIEW_BATCH_SIZE]
+            previews = read_previews(preview_et, [file_paths[i] for i in chunk]) if preview_et else {}
+            for i in chunk:
+                preview = previews.get(path_key(file_paths[i]))
+                # The preview's size is unknown (0), it is measured after decoding
+                full_side = 0 if preview is not None else long_side(metrics_list[i])
+                visual_jobs[i] = pool.submit(analyze_visual, file_paths[i], cfg.analysis_size, False,
+                                             preview, get_bright_range(cfg), full_side)
+
+    queue_visual(cached)
+    done = 0
+    for metadata in read_all_metadata(et, [file_paths[i] for i in uncached]):
+        batch = uncached[done:done + len(metadata)]
+        done += len(metadata)
+        for i, m in zip(batch, metadata):
+            metrics_list[i] = get_image_metrics(m)
+        queue_visual(batch)
+    return visual_jobs
+
+# Format string helpers: return "<value> (PASS|FAIL)".
+# One function per operator, the operator is always known where they are called.
+def grade_le(val, threshold, unit=""):
+    return f"{val:.2f}{unit} {'(PASS)' if val <= threshold else '(FAIL)'}"
+
+def grade_ge(val, threshold, unit=""):
+    return f"{val:.2f}{unit} {'(PASS)' if val >= threshold else '(FAIL)'}"
+
+def evaluate_metadata(metrics, cfg):
+    """
+    Cheap checks that only need the image metadata (no pixel data).
+    Returns (is_good, reason_list)
     """
     reasons = []
-    is_good = True
-    
-    # Format string helpers
-    def grade(val, threshold, operator, unit=""):
-        passed = False
-        if operator == ">": passed = val > threshold
-        elif operator == "<": passed = val < threshold
-        elif operator == "<=": passed = val <= threshold
-        elif operator == ">=": passed = val >= threshold
-        
-        status = "(PASS)" if passed else "(FAIL)"
-        return f"{val:.2f}{unit} {status}", passed
 
     # 1. Resolution
-    res_str = f"{metrics['width']}x{metrics['height']}"
-    if metrics['width'] < cfg['min_w'] or metrics['height'] < cfg['min_h']:
-        reasons.append(f"Low Resolution ({res_str})")
-        is_good = False
-    
-    # 2. Zoom Checks
-    # Optical Labeling
-    optical_type = "Wide"
-    if metrics['focal_length'] > 80: # Arbitrary cutoff for "Zoom" lens description
-        optical_type = "Zoom"
-        
-    # Digital Zoom Check
-    dzoom_str, dzoom_pass = grade(metrics['digital_zoom'], cfg['max_zoom'], "<=", "x")
-    if not dzoom_pass:
+    if metrics['width'] < cfg.min_w or metrics['height'] < cfg.min_h:
+        reasons.append(f"Low Resolution ({metrics['width']}x{metrics['height']})")
+
+    # 2. Digital Zoom
+    if metrics['digital_zoom'] > cfg.max_zoom:
         reasons.append(f"Digital Zoom ({metrics['digital_zoom']}x)")
-        is_good = False
 
     # 3. ISO
-    iso_str, iso_pass = grade(metrics['iso'], cfg['max_iso'], "<=")
-    if not iso_pass:
+    if metrics['iso'] > cfg.max_iso:
         reasons.append(f"High ISO ({metrics['iso']})")
-        is_good = False
-        
+
     # 4. Distance (LRF)
-    if metrics['has_distance']:
-        dist_str, dist_pass = grade(metrics['distance'], cfg['min_dist'], ">=", "m")
-        if not dist_pass:
-            reasons.append(f"Too Close ({metrics['distance']}m < {cfg['min_dist']}m)")
-            is_good = False
-    else:
-        dist_str = "N/A (No LRF)" 
-        # Optional: Fail if LRF missing? For now, let's pass it logic-wise but log it.
-    
+    # Optional: Fail if LRF missing? For now, let's pass it logic-wise but log it.
+    if metrics['has_distance'] and metrics['distance'] < cfg.min_dist:
+        reasons.append(f"Too Close ({metrics['distance']}m < {cfg.min_dist}m)")
+
     # 5. Flight Speed
-    speed_str, speed_pass = grade(metrics['speed'], cfg['max_speed'], "<=", "m/s")
-    if not speed_pass:
-        reasons.append(f"Moving Too Fast ({metrics['speed']:.1f} m/s)")
-        is_good = False
+    if metrics['speed_sq'] > cfg.max_speed_sq:
+        reasons.append(f"Moving Too Fast ({math.sqrt(metrics['speed_sq']):.1f} m/s)")
 
-    # 6. Visual Checks (Blur & Brightness)
-    if metrics['load_error']:
-        return False, f"[ERROR] Could not load image: {metrics['load_error']}", [metrics['load_error']]
-        
-    # Blur
-    blur_str, blur_pass = grade(metrics['blur_score'], cfg['min_blur'], ">=")
-    if not blur_pass:
+    return not reasons, reasons
+
+def metrics_column(metrics_list, key, dtype=np.float64):
+    """One metric of every image as a numpy array (None, i.e. not measured, becomes NaN)."""
+    if dtype is bool:
+        return np.fromiter((m[key] for m in metrics_list), dtype=bool, count=len(metrics_list))
+    return np.fromiter((np.nan if m[key] is None else m[key] for m in metrics_list),
+                       dtype=dtype, count=len(metrics_list))
+
+def metadata_pass_mask(metrics_list, cfg):
+    """
+    evaluate_metadata's verdict for a whole folder at once, as column-wise numpy comparisons.
+    Returns a bool array: True where the image passes every metadata check.
+    """
+    def column(key, dtype=np.float64):
+        return metrics_column(metrics_list, key, dtype)
+
+    return ((column('width') >= cfg.min_w) & (column('height') >= cfg.min_h)
+            & (column('digital_zoom') <= cfg.max_zoom)
+            & (column('iso') <= cfg.max_iso)
+            & (~column('has_distance', bool) | (column('distance') >= cfg.min_dist))
+            & (column('speed_sq') <= cfg.max_speed_sq))
+
+def image_pass_mask(metrics_list, cfg):
+    """
+    evaluate_image's verdict for a whole folder at once.
+    Returns a bool array: True where the image is GOOD.
+    """
+    blur = metrics_column(metrics_list, 'blur_score')
+    bright = metrics_column(metrics_list, 'brightness')
+    loaded = np.fromiter((m['load_error'] is None for m in metrics_list), dtype=bool, count=len(metrics_list))
+
+    # NaN brightness = visual pass skipped (metadata verdict only), NaN blur = blur check skipped
+    visual_good = (loaded & (np.isnan(blur) | (blur >= cfg.min_blur))
+                   & (bright >= cfg.min_bright) & (bright <= cfg.max_bright))
+    return metadata_pass_mask(metrics_list, cfg) & (np.isnan(bright) | visual_good)
+
+def evaluate_visual(metrics, cfg):
+    """
+    Checks on the pixel data (blur & brightness), filled in by analyze_visual.
+    Returns (is_good, reason_list)
+    """
+    reasons = []
+
+    # Blur (skipped when the brightness alone already rejected the image)
+    if metrics['blur_score'] is not None and metrics['blur_score'] < cfg.min_blur:
         reasons.append(f"Blurry (Score: {metrics['blur_score']:.1f})")
-        is_good = False
 
     # Brightness
-    bright_val = metrics['brightness']
-    bright_status = "(PASS)"
-    if bright_val < cfg['min_bright']:
-        reasons.append(f"Too Dark ({bright_val:.1f})")
-        bright_status = "(FAIL: Dark)"
-        is_good = False
-    elif bright_val > cfg['max_bright']:
-        reasons.append(f"Overexposed ({bright_val:.1f})")
-        bright_status = "(FAIL: Bright)"
-        is_good = False
-    bright_str = f"{bright_val:.1f} {bright_status}"
+    if metrics['brightness'] < cfg.min_bright:
+        reasons.append(f"Too Dark ({metrics['brightness']:.1f})")
+    elif metrics['brightness'] > cfg.max_bright:
+        reasons.append(f"Overexposed ({metrics['brightness']:.1f})")
+
+    return not reasons, reasons
+
+def evaluate_image(metrics, cfg):
+    """
+    Decides if an image is GOOD or BAD based on metrics.
+    The details for the log are built separately by format_log, only where they are shown.
+    Returns (is_good, reason_list)
+    """
+    is_good, reasons = evaluate_metadata(metrics, cfg)
+
+    # An unreadable file also fails the resolution check (0x0): the actual error goes first
+    if metrics['meta_error'] and not is_good:
+        reasons.insert(0, metrics['meta_error'])
+
+    # Visual pass was skipped because the metadata already rejected the image
+    if metrics['brightness'] is None:
+        return is_good, reasons
+
+    # 6. Visual Checks (Blur & Brightness)
+    if metrics['load_error']:
+        return False, [metrics['load_error']] + reasons
+
+    visual_good, visual_reasons = evaluate_visual(metrics, cfg)
+    return is_good and visual_good, reasons + visual_reasons
+
+def format_log(metrics, cfg):
+    """
+    Details line of an evaluated image, every value with its PASS/FAIL grade.
+    Format: Lens: Zoom (168mm) | DigZoom: 1.00x (PASS) | Dist: 120.00m (PASS) | ... | Bright: 154.1 (PASS)
+    """
+    if metrics['brightness'] is not None and metrics['load_error']:
+        return f"[ERROR] Could not load image: {metrics['load_error']}"
 
-    # Construct Log String
-    # Format: [ OPTICAL: Zoom | DIG_ZOOM: 1.0 (PASS) | DIST: 120m (PASS) | ... ]
-    log_string = (
+    # Optical Labeling
+    optical_type = "Zoom" if metrics['focal_length'] > 80 else "Wide" # Arbitrary cutoff for "Zoom" lens description
+
+    dzoom_str = grade_le(metrics['digital_zoom'], cfg.max_zoom, "x")
+    dist_str = grade_ge(metrics['distance'], cfg.min_dist, "m") if metrics['has_distance'] else "N/A (No LRF)"
+    speed = math.sqrt(metrics['speed_sq'])
+    speed_str = f"{speed:.2f}m/s {'(PASS)' if metrics['speed_sq'] <= cfg.max_speed_sq else '(FAIL)'}"
+    meta_log = (
         f"Lens: {optical_type} ({int(metrics['focal_length'])}mm) | "
         f"DigZoom: {dzoom_str} | "
         f"Dist: {dist_str} | "
-        f"Speed: {speed_str} | "
-        f"Blur: {blur_str} | "
-        f"Bright: {bright_str}"
+        f"Speed: {speed_str}"
     )
 
-    return is_good, log_string, reasons
+    # Visual pass was skipped because the metadata already rejected the image
+    if metrics['brightness'] is None:
+        return f"{meta_log} | Blur: Skipped | Bright: Skipped"
+
+    blur_str = "Skipped" if metrics['blur_score'] is None else grade_ge(metrics['blur_score'], cfg.min_blur)
+    bright_val = metrics['brightness']
+    if bright_val < cfg.min_bright:
+        bright_status = "(FAIL: Dark)"
+    elif bright_val > cfg.max_bright:
+        bright_status = "(FAIL: Bright)"
+    else:
+        bright_status = "(PASS)"
+
+    return f"{meta_log} | Blur: {blur_str} | Bright: {bright_val:.1f} {bright_status}"
+
+# Status lines per file are written to the console in bursts of this many files
+CONSOLE_FLUSH_EVERY = 50
+
+# Visual pass progress is printed every this many images
+VISUAL_PROGRESS_EVERY = 50
+
+@contextlib.contextmanager
+def buffered_console():
+    """
+    Turns off the flush after every line printed to an interactive console (slow, on
+    Windows terminals especially), the caller flushes every CONSOLE_FLUSH_EVERY files.
+    """
+    line_buffering = getattr(sys.stdout, 'line_buffering', False)
+    if line_buffering:
+        sys.stdout.reconfigure(line_buffering=False)
+    try:
+        yield
+    finally:
+        if sys.stdout is not None:
+            sys.stdout.flush()
+        if line_buffering:
+            sys.stdout.reconfigure(line_buffering=True)
+
+MOVE_THREADS = 4
+
+def move_file(src, dst):
+    """Moves a file; a single rename when both paths are on the same volume (the normal case)."""
+    try:
+        os.replace(src, dst)
+    except OSError:
+        shutil.move(src, dst) # Different volume: copy + delete
+
+# Per-folder cache of computed metrics, so re-runs (e.g. after tuning thresholds) skip the heavy work
+CACHE_FILE = '.sortcache.db'
+
+def visual_settings(cfg):
+    """The settings blur/brightness values depend on, stored with every cache entry."""
+    return json.dumps({'analysis_size': cfg.analysis_size, 'use_preview': cfg.use_preview,
+                       'gpu_decode': cfg.gpu_decode})
+
+def open_metrics_cache(base_dir):
+    """Opens (or creates) the metrics cache of a folder. Returns None if it can't be used."""
+    try:
+        db = sqlite3.connect(os.path.join(base_dir, CACHE_FILE))
+        db.execute("CREATE TABLE IF NOT EXISTS cached_metrics "
+                   "(name TEXT PRIMARY KEY, size INTEGER, mtime REAL, visual_settings TEXT, metrics TEXT)")
+        return db
+    except sqlite3.Error as e:
+        print(f"WARNING: Metrics cache disabled ({e})")
+        return None
+
+def load_cached_metrics(db, file_path, st, settings):
+    """
+    Returns the cached metrics of the file, or None if missing or the file changed since
+    (st = its current os.stat result, compared by size and modification time).
+    If the blur/brightness were measured with other settings (see visual_settings), only
+    the metadata part is reused and the visual pass runs again.
+    """
+    if db is None:
+        return None
+    row = db.execute("SELECT size, mtime, visual_settings, metrics FROM cached_metrics WHERE name = ?",
+                     (os.path.basename(file_path),)).fetchone()
+    if row and row[0] == st.st_size and row[1] == st.st_mtime:
+        metrics = json.loads(row[3])
+        # Entries written by an older version with different fields are recomputed
+        if metrics.keys() == get_image_metrics(None).keys():
+            if row[2] != settings:
+                metrics['blur_score'] = metrics['brightness'] = metrics['load_error'] = None
+            return metrics
+    return None
+
+def save_cached_metrics(db, updates, settings):
+    """
+    Stores [(file_path, stat, metrics), ...] in one transaction and closes the cache.
+    Files that could not be read are left out: the error may be temporary (locked file,
+    network share), and moving files back keeps their mtime, so they are read again next run.
+    """
+    if db is None:
+        return
+    with db:
+        db.executemany("INSERT OR REPLACE INTO cached_metrics VALUES (?, ?, ?, ?, ?)",
+                       [(os.path.basename(p), st.st_size, st.st_mtime, settings, json.dumps(m))
+                        for p, st, m in updates if not (m['load_error'] or m['meta_error'])])
+    db.close()
 
 def main():
     # Load Config
     script_dir = get_script_dir()
     cfg = load_config(script_dir)
+    if '--fast' in sys.argv[1:]:
+        cfg = replace(cfg, fast_reject=True)
 
     # Determine Input Directory
-    base_dir = cfg['img_folder']
+    base_dir = cfg.img_folder
     if base_dir == '.' or base_dir.strip() == "":
         base_dir = script_dir
     
@@ -299,24 +800,48 @@ def main():
     # Force reconfiguration of logging
     for handler in logging.root.handlers[:]:
         logging.root.removeHandler(handler)
-    logging.basicConfig(filename=log_path, level=logging.INFO, format='%(asctime)s - %(message)s')
+    # Records are collected in memory and appended to the file in one write at the end,
+    # instead of one write per image. Timestamps are taken when the record is created.
+    log_stream = io.StringIO()
+    log_handler = logging.StreamHandler(log_stream)
+    log_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    logging.root.addHandler(log_handler)
+    logging.root.setLevel(logging.INFO)
     
     print(f"--- Processing folder: {base_dir} ---")
     print(f"Log File: {log_path}")
     print(f"FILTERS LOADED FROM CONFIG:")
-    print(f"  > Dist >= {cfg['min_dist']}m")
-    print(f"  > Speed <= {cfg['max_speed']}m/s")
-    print(f"  > Zoom <= {cfg['max_zoom']}x")
-    print(f"  > Blur Score >= {cfg['min_blur']}")
+    print(f"  > Dist >= {cfg.min_dist}m")
+    print(f"  > Speed <= {cfg.max_speed}m/s")
+    print(f"  > Zoom <= {cfg.max_zoom}x")
+    if cfg.analysis_size:
+        print(f"  > Blur Score >= {cfg.min_blur} (measured at {cfg.analysis_size} px long edge)")
+        print("WARNING: Blur scores of shrunk images are much higher than at full resolution. "
+              "Make sure min_blur_score was calibrated for this analysis_size.")
+    elif cfg.use_preview:
+        print(f"  > Blur Score >= {cfg.min_blur} (measured on the embedded previews)")
+    else:
+        print(f"  > Blur Score >= {cfg.min_blur} (measured at full resolution)")
+    if cfg.use_preview:
+        print("WARNING: Blur scores of embedded previews are much higher than at full resolution. "
+              "Make sure min_blur_score was calibrated on the previews.")
+    if cfg.gpu_decode and NvJpeg is None:
+        print("WARNING: gpu_decode is enabled but nvjpeg-python is not installed. Decoding on the CPU.")
+    if cfg.fast_reject:
+        print("Fast reject: images rejected by their metadata are logged without details.")
     print("-" * 60)
     
     # Get all images
+    # One directory scan: DirEntry knows the file type without a stat call per file.
+    # Only regular files qualify, so the _GOOD_IMAGES / _BAD_IMAGES folders are skipped here.
     valid_extensions = ('.jpg', '.jpeg', '.png', '.dng', '.tiff')
-    files = [f for f in os.listdir(base_dir) if f.lower().endswith(valid_extensions)]
+    with os.scandir(base_dir) as entries:
+        images = [e for e in entries if e.name.lower().endswith(valid_extensions) and e.is_file()]
+    filepaths = [e.path for e in images]
     
-    print(f"Found {len(files)} images.")
+    print(f"Found {len(filepaths)} images.")
 
-    if not files:
+    if not filepaths:
         print("No images found to process.")
         print("\nDone! Press Enter to exit.")
         input()
@@ -354,7 +879,6 @@ def main():
             print("Verifying execution permissions...")
             try:
                  # Try to invoke version to check if it runs
-                 import subprocess
                  # We must set CWD to the folder containing exiftool.exe for it to find its files!
                  result = subprocess.run([exif_executable, '-ver'], capture_output=True, text=True, cwd=os.path.dirname(exif_executable))
                  if result.returncode == 0:
@@ -387,8 +911,13 @@ def main():
     try:
         print("Starting ExifTool Engine...")
         # Use 'executable' argument to force specific path if found locally
-        # Note: PyExifTool's helper accepts 'executable' in constructor
-        with exiftool.ExifToolHelper(executable=exif_executable) as et:
+        # The plain ExifTool class: only bulk calls are made, so the helper's per-call
+        # parameter checks and exit-status check (one unreadable file would fail the batch) aren't wanted.
+        # -fast2 skips trailer and MakerNote parsing, none of the tags we read live there.
+        # Embedded previews can, so they get a second session without it (use_preview only).
+        preview_et = exiftool.ExifTool(executable=exif_executable, common_args=["-n"]) if cfg.use_preview else None
+        with exiftool.ExifTool(executable=exif_executable, common_args=["-fast2", "-n", "-G"]) as et, \
+                preview_et or contextlib.nullcontext():
             # Check connection first
             if not et.running:
                 print("Launching subprocess...")
@@ -397,60 +926,109 @@ def main():
             print("ExifTool Engine Started.")
             print("-" * 60)
 
-            for filename in files:
-                filepath = os.path.join(base_dir, filename)
-                
-                # Skip if it's already in the output folders
-                if filepath.startswith(good_dir) or filepath.startswith(bad_dir):
-                    continue
-                
-                if not os.path.isfile(filepath):
-                    continue
-
-                print(f"Checking: {filename}...", end=" ")
-
-                # Step 1: Gather Metrics
-                metrics = get_image_metrics(filepath, et)
-                
-                # Step 2: Evaluate
-                is_good, log_string, reasons = evaluate_image(metrics, cfg)
-                
-                # Step 3: Act
-                if is_good:
-                    print(f"✅ GOOD")
-                    print(f"   Details: {log_string}")
-                    logging.info(f"{filename} [ACCEPTED] -> {log_string}")
-                    try:
-                        shutil.move(filepath, os.path.join(good_dir, filename))
-                    except Exception as e:
-                        print(f"   Error moving file: {e}")
-                else:
-                    reason_str = ", ".join(reasons)
-                    print(f"❌ BAD -> {reason_str}")
-                    print(f"   Details: {log_string}")
-                    logging.info(f"{filename} [REJECTED] -> Reasons: {reason_str} || {log_string}")
+            # Images seen by an earlier run (same name, size and modification time) reuse their metrics.
+            # On Windows the stat comes with the directory scan, elsewhere it is one call per file.
+            cache = open_metrics_cache(base_dir)
+            stats = [e.stat() for e in images]
+            settings = visual_settings(cfg)
+            metrics_list = [load_cached_metrics(cache, p, st, settings) for p, st in zip(filepaths, stats)]
+            cache_hits = [m is not None for m in metrics_list]
+
+            # Visual analysis (decode + Laplacian) runs on every core in parallel
+            pool = create_visual_pool(cfg)
+            with pool or contextlib.nullcontext():
+                # Step 1: Gather Metrics (metadata first, it decides which images need the visual pass)
+                visual_jobs = gather_metrics(et, preview_et, filepaths, [st.st_size for st in stats],
+                                             metrics_list, cfg, pool)
+                print(f"{len(visual_jobs)} images need visual analysis.")
+                if pool is None:
+                    local_jobs = list(visual_jobs)
+                    local_results = iter_visual_results([filepaths[i] for i in local_jobs],
+                                                        [long_side(metrics_list[i]) for i in local_jobs],
+                                                        preview_et, cfg)
+
+                # Collected in the order they were queued (by file size), the results are reported in folder order
+                for done, i in enumerate(visual_jobs, 1):
+                    visual = next(local_results) if pool is None else visual_jobs[i].result()
+                    metrics = metrics_list[i]
+                    metrics['blur_score'], metrics['brightness'], metrics['load_error'] = visual
+                    if done % VISUAL_PROGRESS_EVERY == 0 or done == len(visual_jobs):
+                        print(f"  Visual: {done}/{len(visual_jobs)}")
+
+            cache_updates = [(filepath, st, metrics) for i, (filepath, st, metrics)
+                             in enumerate(zip(filepaths, stats, metrics_list)) if not cache_hits[i] or i in visual_jobs]
+
+            # Step 2: Evaluate (every verdict at once, the reasons are only spelled out for rejects)
+            verdicts = image_pass_mask(metrics_list, cfg)
+
+            # Files are only moved once everything is analyzed, so the filesystem churn
+            # (and any antivirus watching the folder) doesn't compete with the analysis
+            moves = []
+
+            # Status lines reach the console in bursts, not one flush per line
+            with buffered_console():
+                for i, (filepath, metrics, is_good) in enumerate(zip(filepaths, metrics_list, verdicts)):
+                    filename = os.path.basename(filepath)
+                    print(f"Checking: {filename}...", end=" ")
+
+                    # Step 3: Act
+                    if is_good:
+                        log_string = format_log(metrics, cfg)
+                        print(f"✅ GOOD")
+                        print(f"   Details: {log_string}")
+                        logging.info(f"{filename} [ACCEPTED] -> {log_string}")
+                        moves.append((filepath, os.path.join(good_dir, filename)))
+                    else:
+                        _, reasons = evaluate_image(metrics, cfg)
+                        reason_str = ", ".join(reasons)
+                        if cfg.fast_reject and metrics['brightness'] is None:
+                            # Rejected on metadata alone (no visual pass): skip the value-by-value breakdown
+                            print(f"❌ BAD (metadata) -> {reason_str}")
+                            logging.info(f"{filename} [REJECTED] (metadata) -> Reasons: {reason_str}")
+                        else:
+                            log_string = format_log(metrics, cfg)
+                            print(f"❌ BAD -> {reason_str}")
+                            print(f"   Details: {log_string}")
+                            logging.info(f"{filename} [REJECTED] -> Reasons: {reason_str} || {log_string}")
+                        moves.append((filepath, os.path.join(bad_dir, filename)))
+
+                    if (i + 1) % CONSOLE_FLUSH_EVERY == 0:
+                        sys.stdout.flush()
+
+            # Step 4: Move
+            # A few moves in flight at once: renames are cheap, but cross-volume copies
+            # keep the disks busier with several writes queued
+            print(f"Moving {len(moves)} files...")
+            with ThreadPoolExecutor(max_workers=MOVE_THREADS) as move_pool:
+                move_jobs = [(src, move_pool.submit(move_file, src, dst)) for src, dst in moves]
+                for src, job in move_jobs:
                     try:
-                        shutil.move(filepath, os.path.join(bad_dir, filename))
+                        job.result()
                     except Exception as e:
-                         print(f"   Error moving file: {e}")
+                        print(f"   Error moving {os.path.basename(src)}: {e}")
+
+            save_cached_metrics(cache, cache_updates, settings)
 
     except Exception as e:
         print(f"\nCRITICAL ERROR during execution: {e}")
         logging.error(f"Critical error: {e}")
-        import traceback
         traceback.print_exc()
         if "exiftool" in str(e).lower():
              print("Make sure exiftool.exe is in the same folder or in your system PATH.")
 
+    # UTF-8: a non-ASCII file name or error text must not fail the write of the whole log
+    with open(log_path, 'a', encoding='utf-8', errors='backslashreplace') as log_file:
+        log_file.write(log_stream.getvalue())
     print("\nDone! Press Enter to exit.")
     input()
 
 if __name__ == "__main__":
+    # Required for the process pool when running as a frozen (PyInstaller) exe
+    multiprocessing.freeze_support()
     try:
         main()
     except Exception as e:
          print(f"FATAL CRASH: {e}")
-         import traceback
          traceback.print_exc()
          input("Press Enter to exit.")
 